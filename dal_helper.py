@@ -14,12 +14,20 @@ __all__ = [
 ]
 
 import argparse
+import json
 import warnings
-from collections.abc import Iterator
+from collections import deque
+from collections.abc import AsyncGenerator, Generator, Iterator
 from datetime import datetime
 from glob import glob
+from itertools import islice
 from pathlib import Path
-from typing import TYPE_CHECKING, Any
+from typing import IO, TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+    from .logging_helper import Progress
 
 
 def pathify(path: Path | str) -> Path:
@@ -139,8 +147,36 @@ datetime_naive = datetime  # for now just an alias
 datetime_aware = datetime  # for now just an alias
 
 
-def json_items(p: Path, key: str | None) -> Iterator[Json]:
+# sharded exports (see export_helper) have a manifest starting with this key
+MANIFEST_KEY = 'exporthelpers_manifest'
+_MANIFEST_HEAD = b'{"' + MANIFEST_KEY.encode() + b'"'
+
+
+def read_manifest(p: Path) -> Json | None:
+    """
+    Returns shards manifest if p is one, otherwise None. Only reads a few bytes for regular files.
+    """
+    with p.open(mode='rb') as fo:
+        if fo.read(len(_MANIFEST_HEAD)) != _MANIFEST_HEAD:
+            return None
+    return json.loads(p.read_text())
+
+
+def _manifest_shards(p: Path, manifest: Json, key: str | None) -> list[Path]:
+    if manifest['key'] != key:
+        raise RuntimeError(f"{p}: shards contain items for key {manifest['key']!r}, but requested {key!r}")
+    return [p.parent / s['path'] for s in manifest['shards']]
+
+
+def json_items(p: Path, key: str | None, *, progress: Progress | None = None) -> Generator[Json, None, None]:
     # if key is None, means we expect list on the top level
+    # progress (see logging_helper.make_progress) gets updated with items and bytes processed
+
+    manifest = read_manifest(p)
+    if manifest is not None:
+        for shard in _manifest_shards(p, manifest, key):
+            yield from json_items(shard, None, progress=progress)
+        return
 
     # todo perhaps add to setup.py as 'optional' or 'faster'?
     try:
@@ -155,7 +191,10 @@ def json_items(p: Path, key: str | None) -> Iterator[Json]:
     else:
         extractor = 'item' if key is None else f'{key}.item'
         with p.open(mode='rb') as fo:
-            yield from ijson.items(fo, extractor, use_float=True)
+            if progress is None:
+                yield from ijson.items(fo, extractor, use_float=True)
+            else:
+                yield from _with_progress(ijson.items(fo, extractor, use_float=True), fo=fo, progress=progress)
         return
 
     try:
@@ -168,7 +207,7 @@ def json_items(p: Path, key: str | None) -> Iterator[Json]:
         j = orjson.loads(p.read_text())
         if key is not None:
             j = j[key]
-        yield from j
+        yield from j if progress is None else _with_progress(j, fo=None, progress=progress, size=p.stat().st_size)
         return
 
     # otherwise just fall back onto regular json
@@ -177,7 +216,160 @@ def json_items(p: Path, key: str | None) -> Iterator[Json]:
     j = json.loads(p.read_text())
     if key is not None:
         j = j[key]
-    yield from j
+    yield from j if progress is None else _with_progress(j, fo=None, progress=progress, size=p.stat().st_size)
+
+
+def _load_shard(p: Path) -> list[Json]:
+    # top level function so it can be used with ProcessPoolExecutor
+    return list(json_items(p, None))
+
+
+def json_items_concurrent(
+    p: Path,
+    key: str | None,
+    *,
+    executor: Executor | None = None,
+    max_workers: int = 4,
+) -> Iterator[Json]:
+    """
+    Same as json_items, but for sharded exports loads up to max_workers shards concurrently (items are still in order).
+
+    By default uses threads, pass ProcessPoolExecutor as executor if parsing is CPU bound.
+    """
+    manifest = read_manifest(p)
+    if manifest is None:
+        yield from json_items(p, key)
+        return
+    shards = _manifest_shards(p, manifest, key)
+
+    own_executor = executor is None
+    if executor is None:
+        # imported here, since concurrent.futures is slow to import and most DALs don't use it
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending: deque[Future[list[Json]]] = deque()
+    try:
+        it = iter(shards)
+        # only keep max_workers shards in flight, otherwise the whole export might end up in memory
+        for shard in islice(it, max_workers):
+            pending.append(executor.submit(_load_shard, shard))
+        while len(pending) > 0:
+            items = pending.popleft().result()
+            next_shard = next(it, None)
+            if next_shard is not None:
+                pending.append(executor.submit(_load_shard, next_shard))
+            yield from items
+    finally:
+        for f in pending:
+            f.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+
+async def json_items_async(
+    p: Path,
+    key: str | None,
+    *,
+    batch_size: int = 1000,
+    max_batches: int = 4,
+    progress: Progress | None = None,
+) -> AsyncGenerator[Json, None]:
+    """
+    Async counterpart of json_items, so loading large exports doesn't block the event loop.
+
+    Parsing happens in a worker thread, which hands items over in batches (to keep cross-thread overhead low)
+    via a queue of at most max_batches, so the parser doesn't run too far ahead of the consumer.
+    If the consumer stops early (or is cancelled), the worker stops and the file is closed.
+    """
+    # imported here, since asyncio is slow to import and most DALs don't use it
+    import asyncio
+    import threading
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[list[Json] | Exception | None] = asyncio.Queue(maxsize=max_batches)
+    stop = threading.Event()
+
+    def put(x: list[Json] | Exception | None) -> bool:
+        """
+        Blocks the worker while the queue is full. Returns False if the consumer went away in the meantime.
+        """
+        if stop.is_set():
+            return False
+        fut = asyncio.run_coroutine_threadsafe(queue.put(x), loop)
+        while True:
+            try:
+                fut.result(timeout=_PUT_POLL_INTERVAL)
+            except TimeoutError:
+                if stop.is_set():
+                    fut.cancel()
+                    return False
+            else:
+                return True
+
+    def worker() -> None:
+        items = json_items(p, key, progress=progress)
+        try:
+            batch: list[Json] = []
+            for item in items:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if len(batch) > 0 and not put(batch):
+                return
+            put(None)
+        except Exception as e:
+            put(e)
+        finally:
+            items.close()  # closes the file if we stopped halfway
+            loop.call_soon_threadsafe(done.set_result, None)
+
+    done = loop.create_future()
+    # own thread rather than loop's default executor, since it's occupied for as long as the consumer is iterating
+    # daemon, so it doesn't block exit if the consumer is abandoned without closing
+    threading.Thread(target=worker, name=f'json_items_async({p})', daemon=True).start()
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            for item in batch:
+                yield item
+    finally:
+        # the worker notices it when it's done with the current batch, or while waiting for space in the queue
+        stop.set()
+        await done
+
+
+_PUT_POLL_INTERVAL = 0.1  # seconds
+
+
+def _with_progress(
+    items: Iterable[Json],
+    *,
+    fo: IO[bytes] | None,
+    progress: Progress,
+    size: int = 0,
+) -> Iterator[Json]:
+    if fo is None:
+        # everything is already in memory at this point, so the whole file counts as processed
+        progress.update(0, nbytes=size)
+        for item in items:
+            progress.update()
+            yield item
+        return
+
+    pos = 0
+    for item in items:
+        # ijson reads in chunks, so it's a bit coarse, but good enough for throughput
+        cur = fo.tell()
+        progress.update(nbytes=cur - pos)
+        pos = cur
+        yield item
 
 
 if not TYPE_CHECKING:
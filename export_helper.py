@@ -1,15 +1,32 @@
 from __future__ import annotations
 
 import argparse
+import enum
+import json
+import logging
+import math
+import os
 import sys
+import time
 import warnings
 from collections.abc import Callable, Iterable, Sequence
 from pathlib import Path
-from typing import Any, overload
+from typing import Any, Protocol, overload
+
+from .logging_helper import Progress, make_progress
 
 Json = dict[str, Any]
 Dumper = Callable[[str], None]
 
+
+class JsonDumper(Protocol):
+    def __call__(self, obj: Any, *, sort_keys: bool = False) -> None: ...
+
+
+class ItemsDumper(Protocol):
+    def __call__(self, items: Iterable[Any], *, key: str | None = None, sort_keys: bool = False) -> None: ...
+
+
 _PARAMS_KEY = 'params'
 _UNSET = object()
 
@@ -62,13 +79,115 @@ If they don't, please feel free to ask or raise an issue!
     return epilog
 
 
-def _make_dumper(output_path: Path | None) -> Dumper:
+class Checkpoint:
+    """
+    Cursor state and partial results for long running exports, so they can resume after a crash/timeout.
+
+    Available as `args.checkpoint`. Typical usage in the exporter:
+
+        ck = args.checkpoint
+        for page in fetch_pages(after=ck.cursor):
+            ck.save(cursor=page.next_cursor, items=page.items)
+        args.dumper(json.dumps(ck.items))
+
+    On rerun with the same --state file, cursor and items are restored from the last save(),
+    so (as long as the export is deterministic) the final output is the same as for uninterrupted run.
+    The state is removed once the data is dumped. Without --state, it's only kept in memory.
+
+    Items should be json serializable (e.g. raw API responses).
+    They are appended to a separate .items.jsonl file, so saving doesn't get slower as the export grows.
+    """
+
+    def __init__(self, path: Path | None) -> None:
+        self.path = path
+        self.cursor: Any = None
+        self.items: list[Any] = []
+        if path is not None and path.exists():
+            self._load(path)
+
+    @property
+    def _items_path(self) -> Path:
+        assert self.path is not None
+        return self.path.with_name(self.path.name + '.items.jsonl')
+
+    def _load(self, path: Path) -> None:
+        state = json.loads(path.read_text())
+        self.cursor = state['cursor']
+        count: int = state['count']
+
+        items_path = self._items_path
+        lines = items_path.read_text().splitlines() if items_path.exists() else []
+        if len(lines) < count:
+            raise RuntimeError(
+                f'{items_path} is missing items (expected {count}, got {len(lines)}), remove {path} to start over'
+            )
+        if len(lines) > count:
+            # crashed after appending items, but before saving the cursor -- these will be fetched again
+            lines = lines[:count]
+            _write_atomic(items_path, ''.join(line + '\n' for line in lines))
+        self.items = [json.loads(line) for line in lines]
+        print(f'resuming from {path}: {count} items so far', file=sys.stderr)
+
+    def save(self, *, cursor: Any, items: Iterable[Any] = ()) -> None:
+        """
+        Appends items to the results so far and saves the cursor to resume from.
+        """
+        new_items = list(items)
+        self.items.extend(new_items)
+        self.cursor = cursor
+        if self.path is None:
+            return
+
+        if len(new_items) > 0:
+            with self._items_path.open('a') as fo:
+                fo.write(''.join(json.dumps(item) + '\n' for item in new_items))
+                fo.flush()
+                os.fsync(fo.fileno())
+        # items are written first, so the state never refers to items which weren't persisted
+        _write_atomic(self.path, json.dumps({'cursor': cursor, 'count': len(self.items)}))
+
+    def clear(self) -> None:
+        if self.path is None:
+            return
+        self.path.unlink(missing_ok=True)
+        self._items_path.unlink(missing_ok=True)
+
+
+def _write_atomic(path: Path, data: str | bytes) -> None:
+    tmp = path.with_name(path.name + '.tmp')
+    with tmp.open('wb' if isinstance(data, bytes) else 'w') as fo:
+        fo.write(data)
+        fo.flush()
+        os.fsync(fo.fileno())
+    tmp.replace(path)
+
+
+# plain logger rather than make_logger, so dumping doesn't set up handlers/file sinks as a side effect
+logger = logging.getLogger(__name__)
+
+
+def _dump_progress(*, unit: str) -> Progress:
+    # debug level, so it's only reported if the user enabled debug logging for this module
+    # otherwise it's NO_PROGRESS (see make_progress), so there is no overhead either
+    return make_progress(logger, 'dump', unit=unit, level=logging.DEBUG)
+
+
+def _make_dumper(output_path: Path | None, *, checkpoint: Checkpoint | None = None) -> Dumper:
+    # NOTE: len(data) is only the same as byte size for ascii, but it's what json.dumps produces by default
     def dump_to_stdout(data: str) -> None:
-        sys.stdout.write(data)
+        with _dump_progress(unit='files') as progress:
+            sys.stdout.write(data)
+            progress.update(nbytes=len(data))
+        if checkpoint is not None:
+            checkpoint.clear()
 
     def dump_to_file(data: str) -> None:
         assert output_path is not None
-        output_path.write_text(data)
+        with _dump_progress(unit='files') as progress:
+            output_path.write_text(data)
+            progress.update(nbytes=len(data))
+        if checkpoint is not None:
+            checkpoint.clear()
         print(f'saved data to {output_path}', file=sys.stderr)
 
     if output_path is None:
@@ -77,6 +196,217 @@ def _make_dumper(output_path: Path | None) -> Dumper:
         return dump_to_file
 
 
+def _json_default(obj: Any) -> Any:
+    # types orjson serializes natively, so the stdlib fallback produces the same output
+    import uuid  # only needed on the slow path
+
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    # datetimes/dataclasses are passed through by orjson (see _json_serializer), so both reject them
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _nan_to_null(obj: Any) -> Any:
+    # orjson serializes NaN/Infinity as null (they aren't valid json)
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _nan_to_null(v) for k, v in obj.items()}
+    if isinstance(obj, list | tuple):
+        return [_nan_to_null(v) for v in obj]
+    return obj
+
+
+def _json_serializer(*, sort_keys: bool) -> Callable[[Any], bytes]:
+    # compact and utf8 like orjson, and both produce the same output
+    encoder = json.JSONEncoder(
+        sort_keys=sort_keys,
+        ensure_ascii=False,
+        separators=(',', ':'),
+        allow_nan=False,
+        default=_json_default,
+    )
+
+    def stdlib_serialize(obj: Any) -> bytes:
+        try:
+            res = encoder.encode(obj)
+        except ValueError as e:
+            if 'Out of range float' not in str(e):
+                raise e
+            # NaN/Infinity somewhere, rare enough to only pay for the extra pass then
+            res = encoder.encode(_nan_to_null(obj))
+        return res.encode('utf8')
+
+    try:
+        import orjson
+    except ModuleNotFoundError as e:
+        if e.name != 'orjson':
+            raise e
+        warnings.warn("recommended to 'pip install orjson' for faster json serialization", stacklevel=4)
+        return stdlib_serialize
+
+    # stdlib json can't serialize datetimes/dataclasses, so these are rejected by orjson too
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+
+    def orjson_serialize(obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, option=option, default=_json_default)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which stdlib json handles fine
+            # unsupported types are rejected by stdlib json as well
+            return stdlib_serialize(obj)
+
+    return orjson_serialize
+
+
+def _json_bytes(obj: Any, *, sort_keys: bool) -> bytes:
+    return _json_serializer(sort_keys=sort_keys)(obj)
+
+
+def _make_json_dumper(output_path: Path | None, *, checkpoint: Checkpoint | None = None) -> JsonDumper:
+    """
+    Serializes straight to bytes (with orjson if available) and writes them without going through text layer.
+    sort_keys makes consecutive exports of the same data byte-identical, so they diff and deduplicate well.
+    """
+
+    def dump_json(obj: Any, *, sort_keys: bool = False) -> None:
+        with _dump_progress(unit='files') as progress:
+            start = time.perf_counter()
+            data = _json_bytes(obj, sort_keys=sort_keys)
+            serialized = time.perf_counter()
+
+            if output_path is None:
+                sys.stdout.flush()  # in case something was written via text layer before
+                sys.stdout.buffer.write(data)
+                sys.stdout.buffer.flush()
+            else:
+                output_path.write_bytes(data)
+            written = time.perf_counter()
+            progress.update(nbytes=len(data))
+
+        logger.debug(
+            'serialized %d bytes in %.3fs, written in %.3fs',
+            len(data),
+            serialized - start,
+            written - serialized,
+        )
+        if checkpoint is not None:
+            checkpoint.clear()
+        if output_path is not None:
+            print(f'saved data to {output_path}', file=sys.stderr)
+
+    return dump_json
+
+
+def _make_items_dumper(
+    output_path: Path | None,
+    *,
+    dump_json: JsonDumper,
+    shard_items: int | None,
+    shard_bytes: int | None,
+    checkpoint: Checkpoint | None = None,
+) -> ItemsDumper:
+    """
+    Dumps a stream of items as a json list (or {key: [...]} if key is passed).
+
+    If --shard-items/--shard-bytes are passed, items are split into numbered shards (`<path>.shards/00000-<hash>.json`, etc.),
+    each of them a json list, and path is a small manifest listing shards with item counts and hashes.
+    dal_helper.json_items reads such manifest as if it was a single file,
+    and dal_helper.json_items_concurrent can read shards in parallel.
+    Shards with unchanged content aren't rewritten.
+    """
+
+    def dump_items(items: Iterable[Any], *, key: str | None = None, sort_keys: bool = False) -> None:
+        if shard_items is None and shard_bytes is None:
+            data = list(items)
+            dump_json(data if key is None else {key: data}, sort_keys=sort_keys)
+            return
+
+        assert output_path is not None  # checked when parsing args
+        with _dump_progress(unit='items') as progress:
+            _dump_shards(
+                output_path,
+                items,
+                key=key,
+                serialize=_json_serializer(sort_keys=sort_keys),
+                shard_items=shard_items,
+                shard_bytes=shard_bytes,
+                progress=progress,
+            )
+        if checkpoint is not None:
+            checkpoint.clear()
+        print(f'saved data to {output_path}', file=sys.stderr)
+
+    return dump_items
+
+
+def _dump_shards(
+    manifest_path: Path,
+    items: Iterable[Any],
+    *,
+    key: str | None,
+    serialize: Callable[[Any], bytes],
+    shard_items: int | None,
+    shard_bytes: int | None,
+    progress: Progress,
+) -> None:
+    # imported here, so exporters which don't shard don't pay for them
+    import hashlib
+
+    from .dal_helper import MANIFEST_KEY
+
+    shards_dir = manifest_path.with_name(manifest_path.name + '.shards')
+    shards_dir.mkdir(exist_ok=True)
+
+    shards: list[dict[str, Any]] = []
+    chunk: list[bytes] = []
+    chunk_size = 2  # brackets
+
+    def flush() -> None:
+        data = b'[' + b','.join(chunk) + b']'
+        sha256 = hashlib.sha256(data).hexdigest()
+        # content addressed, so the old manifest keeps pointing at intact shards until the new one replaces it
+        shard_path = shards_dir / f'{len(shards):05d}-{sha256[:16]}.json'
+        rel_path = f'{shards_dir.name}/{shard_path.name}'
+        if not (shard_path.exists() and shard_path.stat().st_size == len(data)):
+            _write_atomic(shard_path, data)
+        shards.append({'path': rel_path, 'items': len(chunk), 'bytes': len(data), 'sha256': sha256})
+        progress.update(len(chunk), nbytes=len(data))
+
+    for item in items:
+        data = serialize(item)
+        full = (shard_items is not None and len(chunk) >= shard_items) or (
+            shard_bytes is not None and chunk_size + len(data) + 1 > shard_bytes
+        )
+        if full and len(chunk) > 0:
+            flush()
+            chunk = []
+            chunk_size = 2
+        chunk.append(data)
+        chunk_size += len(data) + 1
+    if len(chunk) > 0 or len(shards) == 0:
+        flush()
+
+    manifest = {
+        MANIFEST_KEY: 1,  # should be the first key, it's used to detect the manifest
+        'key': key,
+        'items': sum(s['items'] for s in shards),
+        'shards': shards,
+    }
+    _write_atomic(manifest_path, json.dumps(manifest))
+
+    # only after writing the manifest, so it never refers to missing shards (even if interrupted)
+    # also cleans up .tmp files left behind by an interrupted _write_atomic
+    current = {s['path'] for s in shards}
+    for shard_path in shards_dir.iterdir():
+        if f'{shards_dir.name}/{shard_path.name}' not in current:
+            shard_path.unlink()
+
+
 class Parser(argparse.ArgumentParser):
     """
     ArgumentParser with optional export-helper setup.
@@ -139,6 +469,26 @@ class Parser(argparse.ArgumentParser):
             nargs='?',
             help='Optional path where exported data will be dumped, otherwise printed to stdout',
         )
+        self.add_argument(
+            '--state',
+            metavar='STATE_FILE',
+            type=Path,
+            required=False,
+            help='Checkpoint file to resume interrupted export from (if the exporter supports it)',
+        )
+        shards_gr = self.add_argument_group('Sharded output (if the exporter supports it, requires path)')
+        shards_gr.add_argument(
+            '--shard-items',
+            metavar='N',
+            type=int,
+            help='Split items into shards of at most N items',
+        )
+        shards_gr.add_argument(
+            '--shard-bytes',
+            metavar='N',
+            type=int,
+            help='Split items into shards of at most N bytes',
+        )
 
     @overload
     def parse_args(self, args: Iterable[str] | None = None, namespace: None = None) -> argparse.Namespace: ...
@@ -184,7 +534,31 @@ class Parser(argparse.ArgumentParser):
                 )
 
         setattr(namespace, _PARAMS_KEY, params_dict)
-        setattr(namespace, 'dumper', _make_dumper(getattr(namespace, 'path')))
+        checkpoint = Checkpoint(getattr(namespace, 'state'))
+        setattr(namespace, 'checkpoint', checkpoint)
+        output_path = getattr(namespace, 'path')
+        shard_items: int | None = getattr(namespace, 'shard_items')
+        shard_bytes: int | None = getattr(namespace, 'shard_bytes')
+        if (shard_items is not None or shard_bytes is not None) and output_path is None:
+            self.error("Sharded output (--shard-items/--shard-bytes) requires path")
+        for arg, value in [('--shard-items', shard_items), ('--shard-bytes', shard_bytes)]:
+            if value is not None and value <= 0:
+                self.error(f"{arg} should be positive, got {value}")
+
+        dump_json = _make_json_dumper(output_path, checkpoint=checkpoint)
+        setattr(namespace, 'dumper', _make_dumper(output_path, checkpoint=checkpoint))
+        setattr(namespace, 'dump_json', dump_json)
+        setattr(
+            namespace,
+            'dump_items',
+            _make_items_dumper(
+                output_path,
+                dump_json=dump_json,
+                shard_items=shard_items,
+                shard_bytes=shard_bytes,
+                checkpoint=checkpoint,
+            ),
+        )
 
     def _read_params_from_file(self, secrets_file: Path) -> dict[str, Any]:
         params = self._export_params
@@ -1,16 +1,24 @@
 from __future__ import annotations
 
+import atexit
+import gzip
+import json
 import logging
+import logging.handlers
+import math
 import os
+import shutil
 import sys
+import threading
+import time
 import warnings
-from functools import lru_cache
-from typing import TYPE_CHECKING
+from collections.abc import Callable
+from functools import lru_cache, wraps
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Self
 
 
 def test() -> None:
-    from collections.abc import Callable
-
     M: Callable[[str], None] = lambda s: print(s, file=sys.stderr)
 
     ## prepare exception for later
@@ -57,6 +65,8 @@ def test() -> None:
 
 
 DEFAULT_LEVEL = 'INFO'
+DEFAULT_FILE_LEVEL = 'DEBUG'
+DEFAULT_FILE_MAX_BYTES = 100 * 1024 * 1024
 FORMAT = '{start}[%(levelname)-7s %(asctime)s %(name)s %(filename)s:%(lineno)-4d]{end} %(message)s'
 FORMAT_NOCOLOR = FORMAT.format(start='', end='')
 
@@ -94,9 +104,28 @@ def get_env_level(name: str) -> Level | None:
     return None
 
 
-def setup_logger(logger: str | logging.Logger, *, level: LevelIsh = None) -> None:
+def get_file_sink() -> tuple[Path, Level] | None:
+    # e.g. LOGGING_FILE=/tmp/export.log LOGGING_FILE_LEVEL=debug
+    # if the file has .jsonl extension, log records are written as json objects, one per line
+    path = os.environ.get('LOGGING_FILE', None)
+    if path is None:
+        return None
+    level = os.environ.get('LOGGING_FILE_LEVEL', None)
+    return Path(path), mklevel(level or DEFAULT_FILE_LEVEL)
+
+
+def setup_logger(
+    logger: str | logging.Logger,
+    *,
+    level: LevelIsh = None,
+    file: Path | str | None = None,
+    file_level: LevelIsh = None,
+) -> None:
     """
     Wrapper to simplify logging setup.
+
+    If file is passed (or LOGGING_FILE env variable is set), the logger additionally writes to a buffered file sink.
+    The file sink accepts messages at file_level (DEBUG by default), whereas the terminal keeps logging at level.
     """
     if isinstance(logger, str):
         logger = logging.getLogger(logger)
@@ -111,28 +140,81 @@ def setup_logger(logger: str | logging.Logger, *, level: LevelIsh = None) -> Non
     else:
         lvl = mklevel(level)
 
-    if logger.level == logging.NOTSET:
-        # if it's already set, the user requested a different logging level, let's respect that
-        logger.setLevel(lvl)
+    if file is not None:
+        file_sink: tuple[Path, Level] | None = (Path(file), mklevel(file_level or DEFAULT_FILE_LEVEL))
+    else:
+        file_sink = get_file_sink()
+
+    if file_sink is None:
+        if logger.level == logging.NOTSET:
+            # if it's already set, the user requested a different logging level, let's respect that
+            logger.setLevel(lvl)
+        _setup_handlers_and_formatters(name=logger.name)
+    else:
+        file_path, file_lvl = file_sink
+        handler = _setup_handlers_and_formatters(name=logger.name)
+        if logger.level == logging.NOTSET:
+            # logger has to let through everything the file wants, terminal handler filters the rest on its own
+            # one below the actual minimum, so it's possible to tell if the user changed the level later
+            auto_level = max(min(lvl, file_lvl) - 1, 1)
+            logger.setLevel(auto_level)
+            handler.follow_logger(logger, level=lvl, auto_level=auto_level)
+        file_handler = _setup_file_handler(name=logger.name, path=file_path.absolute())
+        if file_handler.level == logging.NOTSET or file_lvl < file_handler.level:
+            file_handler.setLevel(file_lvl)
+
+
+class _TerminalLevel:
+    """
+    Handler mixin for the file sink case: the logger accepts more than we want to display on the terminal,
+    so the handler level filters the rest.
+    If the logger level was changed after setup (e.g. getLogger(name).setLevel(logging.DEBUG)), defers to the logger.
+
+    Done via the level attribute rather than a filter, since Logger.callHandlers checks it before even calling handle(),
+    and most records rejected here are debug messages meant for the file.
+    """
 
-    _setup_handlers_and_formatters(name=logger.name)
+    _level: Level = logging.NOTSET
+    _logger: logging.Logger | None = None
+    _auto_level: Level = logging.NOTSET
+
+    @property
+    def level(self) -> Level:
+        logger = self._logger
+        if logger is not None and logger.level != self._auto_level:
+            return logging.NOTSET
+        return self._level
+
+    @level.setter
+    def level(self, level: Level) -> None:
+        self._level = level
+
+    def follow_logger(self, logger: logging.Logger, *, level: Level, auto_level: Level) -> None:
+        self._logger = logger
+        self._auto_level = auto_level
+        self.level = level
+
+
+class _TerminalHandler(_TerminalLevel, logging.StreamHandler):
+    pass
 
 
 # cached since this should only be done once per logger instance
 @lru_cache(None)
-def _setup_handlers_and_formatters(name: str) -> None:
+def _setup_handlers_and_formatters(name: str) -> _TerminalHandler | CollapseLogsHandler:
     logger = logging.getLogger(name)
 
     logger.addFilter(AddExceptionTraceback())
 
     collapse_level = get_collapse_level()
+    handler: _TerminalHandler | CollapseLogsHandler
     if collapse_level is None or not sys.stderr.isatty():
-        handler = logging.StreamHandler()
+        handler = _TerminalHandler()
     else:
         handler = CollapseLogsHandler(maxlevel=collapse_level)
 
     # default level for handler is NOTSET, which will make it process all messages
-    # we rely on the logger to actually accept/reject log msgs
+    # we rely on the logger to actually accept/reject log msgs (see _TerminalLevel for the file sink case)
     logger.addHandler(handler)
 
     # this attribute is set to True by default, which causes log entries to be passed to root logger (e.g. if you call basicConfig beforehand)
@@ -156,6 +238,24 @@ def _setup_handlers_and_formatters(name: str) -> None:
             formatter = logging.Formatter(FORMAT_NOCOLOR)
 
     handler.setFormatter(formatter)
+    return handler
+
+
+@lru_cache(None)
+def _setup_file_handler(name: str, path: Path) -> BufferedFileHandler:
+    handler = _get_file_handler(path)
+    logging.getLogger(name).addHandler(handler)
+    return handler
+
+
+# shared between loggers, otherwise different handlers would clobber each other's writes/rotations
+@lru_cache(None)
+def _get_file_handler(path: Path) -> BufferedFileHandler:
+    max_bytes = int(os.environ.get('LOGGING_FILE_MAX_BYTES', DEFAULT_FILE_MAX_BYTES))
+    compress = os.environ.get('LOGGING_FILE_COMPRESS', None) is not None
+    handler = BufferedFileHandler(path, max_bytes=max_bytes, compress=compress)
+    handler.setFormatter(JsonFormatter() if path.suffix == '.jsonl' else FastFormatter())
+    return handler
 
 
 # by default, logging.exception isn't logging traceback unless called inside of the exception handler
@@ -173,8 +273,114 @@ class AddExceptionTraceback(logging.Filter):
         return True
 
 
-# todo also save full log in a file?
-class CollapseLogsHandler(logging.StreamHandler):
+class SuppressRepeats(logging.Filter):
+    """
+    Collapses repeats of the same (logger, level, message template) within window seconds, e.g. if some warning is logged for each item.
+
+    The first message in the window is let through, the rest are counted (except every sample-th one, if sample is set),
+    and 'suppressed N similar messages' summary is logged once the window is over.
+    Messages with level above maxlevel are never suppressed.
+
+    Use suppress_repeats() to enable it for a logger.
+    """
+
+    def __init__(self, *, window: float = 60.0, sample: int | None = None, maxlevel: Level = logging.WARNING) -> None:
+        super().__init__()
+        self.window = window
+        self.sample = sample
+        self.maxlevel = maxlevel
+        # key -> [window start, suppressed count, repeats count]
+        self._state: dict[tuple[str, int, str], list[Any]] = {}
+        self._next_sweep = 0.0
+        # logger filters run in the caller's thread, and exceptions in them aren't handled by logging
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.maxlevel or getattr(record, 'suppress_summary', False):
+            return True
+        msg = record.msg
+        if not isinstance(msg, str):
+            # e.g. exceptions (see AddExceptionTraceback), not much point trying to group these
+            return True
+
+        now = record.created
+        key = (record.name, record.levelno, msg)
+        summaries: list[tuple[tuple[str, int, str], int]] = []
+        with self._lock:
+            if now >= self._next_sweep:
+                summaries.extend(self._sweep(now))
+
+            st = self._state.get(key)
+            if st is None or now - st[0] >= self.window:
+                if st is not None:
+                    summaries.append((key, st[1]))
+                self._state[key] = [now, 0, 0]
+                res = True
+            else:
+                st[2] += 1
+                if self.sample is not None and st[2] % self.sample == 0:
+                    res = True
+                else:
+                    st[1] += 1
+                    res = False
+        # logged outside the lock, since it goes through the handlers
+        for k, suppressed in summaries:
+            self._summarize(k, suppressed)
+        return res
+
+    def _summarize(self, key: tuple[str, int, str], suppressed: int) -> None:
+        if suppressed == 0:
+            return
+        name, level, msg = key
+        logger = logging.getLogger(name)
+        # straight to the handlers, since this might be called from within the logger's own filter
+        # newer python versions guard against logging recursively from there, and would silently drop the record
+        record = logger.makeRecord(
+            name,
+            level,
+            '(unknown file)',
+            0,
+            'suppressed %d similar messages: %s',
+            (suppressed, msg),
+            None,
+            extra={'suppress_summary': True},
+        )
+        logger.callHandlers(record)
+
+    def _sweep(self, now: float) -> list[tuple[tuple[str, int, str], int]]:
+        # periodically report on messages which stopped repeating, otherwise we'd only learn about them at exit
+        expired = [key for key, st in self._state.items() if now - st[0] >= self.window]
+        self._next_sweep = now + self.window
+        return [(key, self._state.pop(key)[1]) for key in expired]
+
+    def flush(self) -> None:
+        with self._lock:
+            state = self._state
+            self._state = {}
+        for key, st in state.items():
+            self._summarize(key, st[1])
+
+
+def suppress_repeats(
+    logger: str | logging.Logger,
+    *,
+    window: float = 60.0,
+    sample: int | None = None,
+    maxlevel: LevelIsh = logging.WARNING,
+) -> SuppressRepeats:
+    """
+    Enables SuppressRepeats filter for the logger. Remaining summaries are flushed at exit.
+    """
+    if isinstance(logger, str):
+        logger = logging.getLogger(logger)
+    filt = SuppressRepeats(window=window, sample=sample, maxlevel=mklevel(maxlevel))
+    logger.addFilter(filt)
+    # registered after logging's own atexit hook, so runs before logging is shut down
+    atexit.register(filt.flush)
+    return filt
+
+
+class CollapseLogsHandler(_TerminalLevel, logging.StreamHandler):
     '''
     Collapses subsequent debug log lines and redraws on the same line.
     Hopefully this gives both a sense of progress and doesn't clutter the terminal as much?
@@ -208,31 +414,548 @@ class CollapseLogsHandler(logging.StreamHandler):
             self.handleError(record)
 
 
-def make_logger(name: str, *, level: LevelIsh = None) -> logging.Logger:
+class FastFormatter(logging.Formatter):
+    """
+    Same output as logging.Formatter(FORMAT_NOCOLOR), but way cheaper, since it's used for every debug message in the file sink.
+    Most of the cost of the regular formatter is in the generic %-style machinery and formatting the timestamp,
+    so the former is replaced with an f-string, and the latter is only recomputed once a second.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(FORMAT_NOCOLOR)
+        self._second: int | None = None
+        self._asctime = ''
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str | None = None) -> str:  # noqa: N802
+        if datefmt is not None:
+            return super().formatTime(record, datefmt)
+        second = int(record.created)
+        if second != self._second:
+            self._asctime = time.strftime('%Y-%m-%d %H:%M:%S', self.converter(second))
+            self._second = second
+        return f'{self._asctime},{int(record.msecs):03d}'
+
+    def format(self, record: logging.LogRecord) -> str:
+        if record.exc_info or record.exc_text or record.stack_info:
+            # rare enough, not worth duplicating
+            return super().format(record)
+        asctime = self.formatTime(record)
+        return f'[{record.levelname:<7} {asctime} {record.name} {record.filename}:{record.lineno:<4}] {record.getMessage()}'
+
+
+class JsonFormatter(FastFormatter):
+    """
+    Formats log records as json objects, one per line (jsonl), so they are easy to grep/jq through later.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        res = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'name': record.name,
+            'filename': record.filename,
+            'lineno': record.lineno,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            res['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(res, ensure_ascii=False, default=str)
+
+
+class BufferedFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Accumulates formatted records in memory and writes them to the file in batches.
+
+    Unlike regular FileHandler, doesn't flush the stream after each record, which makes debug logging way cheaper.
+    The buffer is flushed when it reaches capacity, on records with level >= flush_level, and on close (logging does it at exit).
+    When max_bytes is set, rotates the file similarly to RotatingFileHandler, optionally gzipping the rotated files.
+    """
+
+    def __init__(
+        self,
+        filename: Path | str,
+        *,
+        capacity: int = 1000,
+        flush_level: Level = logging.ERROR,
+        max_bytes: int = 0,
+        backup_count: int = 5,
+        compress: bool = False,
+    ) -> None:
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf8', delay=True)
+        self.capacity = capacity
+        self.flush_level = flush_level
+        self.buffer: list[str] = []
+        if compress:
+            self.namer = lambda name: name + '.gz'
+            self.rotator = _gzip_rotator
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # skips the lock regular Handler.handle takes: appending to the buffer is atomic anyway, and flush takes the lock
+        if len(self.filters) > 0 and not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            msg = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        self.buffer.append(msg)
+        if len(self.buffer) >= self.capacity or record.levelno >= self.flush_level:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:  # type: ignore[union-attr]
+            buffer, self.buffer = self.buffer, []
+            if len(buffer) == 0:
+                return
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes <= 0:
+                self.stream.write('\n'.join(buffer) + '\n')
+                self.stream.flush()
+                return
+
+            # NOTE: sizes are in characters, so only approximate for non-ascii
+            size = self.stream.tell()
+            start = 0
+            for i, msg in enumerate(buffer):
+                msg_size = len(msg) + 1
+                if size > 0 and size + msg_size > self.maxBytes:
+                    if i > start:
+                        self.stream.write('\n'.join(buffer[start:i]) + '\n')
+                    self.doRollover()
+                    if self.stream is None:  # doRollover doesn't reopen if delay=True
+                        self.stream = self._open()
+                    size = 0
+                    start = i
+                size += msg_size
+            self.stream.write('\n'.join(buffer[start:]) + '\n')
+            self.stream.flush()
+
+    def close(self) -> None:
+        # FileHandler.close only flushes if the stream was opened, which isn't the case until the first flush
+        self.flush()
+        super().close()
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, 'rb') as fi, gzip.open(dest, 'wb') as fo:  # noqa: PTH123
+        shutil.copyfileobj(fi, fo)
+    os.remove(source)  # noqa: PTH107
+
+
+def make_logger(
+    name: str,
+    *,
+    level: LevelIsh = None,
+    file: Path | str | None = None,
+    file_level: LevelIsh = None,
+) -> logging.Logger:
     logger = logging.getLogger(name)
-    setup_logger(logger, level=level)
+    setup_logger(logger, level=level, file=file, file_level=file_level)
     return logger
 
 
+def _human_bytes(n: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024:
+            return f'{n:.1f}{unit}'
+        n /= 1024
+    return f'{n:.1f}TB'
+
+
+def _human_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f'{seconds}s'
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f'{minutes}m{seconds:02d}s'
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}h{minutes:02d}m'
+
+
+PROGRESS_INTERVAL = 10.0  # seconds
+PROGRESS_INTERVAL_COLLAPSED = 0.2  # seconds
+
+
+class Progress:
+    """
+    Lightweight progress/throughput counter which periodically reports to a logger.
+
+    Reports items/sec, bytes/sec and ETA (if total or total_bytes is known) every interval seconds, and the final summary on close.
+    If the logger has CollapseLogsHandler collapsing this level, reports way more often since it's redrawn on the same line anyway.
+
+    Use make_progress to create it -- it returns a no-op stub if the logger wouldn't output anything anyway.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        desc: str,
+        *,
+        total: int | None = None,
+        total_bytes: int | None = None,
+        unit: str = 'items',
+        level: Level = logging.INFO,
+        interval: float | None = None,
+    ) -> None:
+        self.logger = logger
+        self.desc = desc
+        self.total = total
+        self.total_bytes = total_bytes
+        self.unit = unit
+        self.level = level
+        if interval is None:
+            interval = PROGRESS_INTERVAL_COLLAPSED if _is_collapsed(logger, level) else PROGRESS_INTERVAL
+        self.interval = interval
+
+        self.count = 0
+        self.nbytes = 0
+        self.closed = False
+        self.start = time.monotonic()
+        self._next_report = self.start + interval
+
+    def update(self, n: int = 1, *, nbytes: int = 0) -> None:
+        self.count += n
+        self.nbytes += nbytes
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            self.logger.log(self.level, '%s', self.summary(now=now), stacklevel=2)
+
+    def summary(self, *, now: float | None = None) -> str:
+        if now is None:
+            now = time.monotonic()
+        elapsed = max(now - self.start, 1e-9)
+
+        count = f'{self.count}' if self.total is None else f'{self.count}/{self.total}'
+        parts = [f'{self.desc}: {count} {self.unit}', f'{self.count / elapsed:.1f} {self.unit}/s']
+        if self.nbytes > 0:
+            parts.append(f'{_human_bytes(self.nbytes)} ({_human_bytes(self.nbytes / elapsed)}/s)')
+
+        done: float | None = None
+        if self.total_bytes:
+            done = self.nbytes / self.total_bytes
+        elif self.total:
+            done = self.count / self.total
+        if done is not None:
+            parts.append(f'{done:.0%}')
+            if not self.closed and done > 0:
+                parts.append(f'ETA {_human_duration(elapsed / done - elapsed)}')
+        parts.append(f'elapsed {_human_duration(elapsed)}')
+        return ' | '.join(parts)
+
+    def close(self) -> None:
+        self._close(stacklevel=3)
+
+    def _close(self, *, stacklevel: int) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.logger.log(self.level, '%s', self.summary(), stacklevel=stacklevel)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self._close(stacklevel=3)
+
+
+class _NoProgress(Progress):
+    """
+    Stub returned when progress reporting is disabled, so it costs as little as possible in the hot loop.
+    """
+
+    # same attributes as Progress, but never updated
+    logger = logging.getLogger(__name__)
+    desc = ''
+    total = None
+    total_bytes = None
+    unit = 'items'
+    level = logging.NOTSET
+    interval = PROGRESS_INTERVAL
+    count = 0
+    nbytes = 0
+    closed = False
+    start = 0.0
+    _next_report = math.inf
+
+    def __init__(self) -> None:
+        pass
+
+    def update(self, n: int = 1, *, nbytes: int = 0) -> None:
+        pass
+
+    def summary(self, *, now: float | None = None) -> str:
+        return ''
+
+    def close(self) -> None:
+        pass
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+
+NO_PROGRESS: Progress = _NoProgress()
+
+
+def _is_collapsed(logger: logging.Logger, level: Level) -> bool:
+    return any(isinstance(h, CollapseLogsHandler) and level <= h.maxlevel for h in logger.handlers)
+
+
+def make_progress(
+    logger: str | logging.Logger,
+    desc: str,
+    *,
+    total: int | None = None,
+    total_bytes: int | None = None,
+    unit: str = 'items',
+    level: LevelIsh = logging.INFO,
+    interval: float | None = None,
+) -> Progress:
+    """
+    Returns a progress counter reporting to the logger, or NO_PROGRESS if the logger isn't enabled for this level.
+
+    E.g. to see progress with LOGGING_COLLAPSE=debug, use level=logging.DEBUG
+    """
+    if isinstance(logger, str):
+        logger = logging.getLogger(logger)
+    lvl = mklevel(level)
+    if not logger.isEnabledFor(lvl):
+        return NO_PROGRESS
+    return Progress(logger, desc, total=total, total_bytes=total_bytes, unit=unit, level=lvl, interval=interval)
+
+
+class _Histogram:
+    """
+    Log-bucketed histogram of durations, so memory doesn't grow with the number of spans.
+    Percentiles are approximate (within HISTOGRAM_BASE relative error), which is plenty to spot where the time goes.
+    """
+
+    __slots__ = ('buckets', 'count', 'logger', 'max', 'total')
+
+    def __init__(self, logger: logging.Logger) -> None:
+        self.logger = logger
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration: float) -> None:
+        # not locked, so concurrent spans might occasionally lose a count, but it's just stats
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        b = math.floor(math.log(duration, HISTOGRAM_BASE)) if duration > 0 else _ZERO_BUCKET
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+
+    def percentile(self, q: float) -> float:
+        target = q * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= target:
+                upper = 0.0 if b == _ZERO_BUCKET else HISTOGRAM_BASE ** (b + 1)
+                return min(upper, self.max)
+        return self.max
+
+    def summary(self) -> str:
+        ps = ' '.join(f'p{int(q * 100)}={_human_seconds(self.percentile(q))}' for q in (0.50, 0.95, 0.99))
+        return f'count={self.count} total={_human_seconds(self.total)} {ps} max={_human_seconds(self.max)}'
+
+
+HISTOGRAM_BASE = 1.1
+_ZERO_BUCKET = -(10**9)  # perf_counter might return the same value twice for very short spans
+
+
+def _human_seconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:.0f}us'
+    if seconds < 1:
+        return f'{seconds * 1e3:.1f}ms'
+    return f'{seconds:.2f}s'
+
+
+_timing_enabled = os.environ.get('LOGGING_TIMING', None) is not None
+_histograms: dict[tuple[str, str], _Histogram] = {}
+
+
+def enable_timing(enabled: bool = True) -> None:
+    """
+    Timing is disabled by default (unless LOGGING_TIMING env variable is set), in which case timed() is a no-op.
+    Note that it's checked when timed() is called, so for decorators it's when the function is defined.
+    """
+    global _timing_enabled
+    _timing_enabled = enabled
+
+
+def _get_histogram(logger: logging.Logger, name: str) -> _Histogram:
+    key = (logger.name, name)
+    hist = _histograms.get(key)
+    if hist is None:
+        if len(_histograms) == 0:
+            # registered after logging's own atexit hook, so runs before logging is shut down
+            atexit.register(log_timings)
+        hist = _Histogram(logger)
+        _histograms[key] = hist
+    return hist
+
+
+class Timed:
+    """
+    Records span durations into a histogram keyed by (logger name, span name).
+
+    Can be used as a context manager or as a decorator, see timed().
+    """
+
+    def __init__(self, logger: logging.Logger, name: str, *, slow: float | None) -> None:
+        self.logger = logger
+        self.name = name
+        self.slow = slow
+        self.hist = _get_histogram(logger, name)
+        # per thread, since the same instance might be shared, e.g. module level span used from worker threads
+        self._local = threading.local()
+
+    def _record(self, duration: float) -> None:
+        self.hist.add(duration)
+        if self.slow is not None and duration >= self.slow:
+            self.logger.warning('slow span %s: took %s', self.name, _human_seconds(duration), stacklevel=3)
+
+    def _starts(self) -> list[float]:
+        starts = getattr(self._local, 'starts', None)
+        if starts is None:
+            starts = []
+            self._local.starts = starts
+        return starts
+
+    def __enter__(self) -> Self:
+        # stack, so the same instance can be reused/nested
+        self._starts().append(time.perf_counter())
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self._record(time.perf_counter() - self._starts().pop())
+
+    def __call__[**P, R](self, func: Callable[P, R]) -> Callable[P, R]:
+        # not going through __enter__/__exit__ so it's safe to use from multiple threads
+        @wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._record(time.perf_counter() - start)
+
+        return wrapper
+
+
+class _NoTimed(Timed):
+    # same attributes as Timed, but the histogram is never updated
+    logger = logging.getLogger(__name__)
+    name = ''
+    slow = None
+    hist = _Histogram(logger)
+    _local = threading.local()
+
+    def __init__(self) -> None:
+        pass
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+    def __call__[**P, R](self, func: Callable[P, R]) -> Callable[P, R]:
+        return func
+
+
+NO_TIMED: Timed = _NoTimed()
+
+
+def timed(logger: str | logging.Logger, name: str, *, slow: float | None = None) -> Timed:
+    """
+    Times a span of code, e.g.
+
+        with timed(logger, 'parse'):
+            ...
+
+        @timed(logger, 'fetch_page', slow=5.0)
+        def fetch_page(...): ...
+
+    If the span takes longer than slow seconds, it's logged as a warning.
+    Timing summary is logged at exit (or call log_timings()).
+    When timing is disabled (see enable_timing), returns NO_TIMED stub which doesn't do anything.
+    """
+    if not _timing_enabled:
+        return NO_TIMED
+    if isinstance(logger, str):
+        # summaries are logged at info level, so the logger needs to be set up to display them
+        logger = make_logger(logger)
+    return Timed(logger, name, slow=slow)
+
+
+def timing_summary() -> dict[tuple[str, str], str]:
+    return {key: hist.summary() for key, hist in _histograms.items() if hist.count > 0}
+
+
+def log_timings(*, reset: bool = False) -> None:
+    for (_, name), hist in list(_histograms.items()):
+        if hist.count > 0:
+            hist.logger.info('timing %s: %s', name, hist.summary())
+    if reset:
+        for hist in _histograms.values():
+            hist.buckets.clear()
+            hist.count = 0
+            hist.total = 0.0
+            hist.max = 0.0
+
+
+class _Noop:
+    """
+    Stub to return instead of enlighten manager so clients don't have to think about it.
+    Way cheaper than Mock, which records all calls.
+    """
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Self:
+        return self
+
+    def __getattr__(self, name: str) -> Self:
+        return self
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        pass
+
+
+_NOOP = _Noop()
+
+
 # ughh. hacky way to have a single enlighten instance per interpreter, so it can be shared between modules
 # not sure about this. I guess this should definitely be behind some flag
 # OK, when stdout is not a tty, enlighten doesn't log anything, good
 def get_enlighten():
     # TODO could add env variable to disable enlighten for a module?
-    from unittest.mock import (
-        Mock,  # Mock to return stub so cients don't have to think about it
-    )
 
     # for now hidden behind the flag since it's a little experimental
     if os.environ.get('ENLIGHTEN_ENABLE', None) is None:
-        return Mock()
+        return _NOOP
 
     try:
         import enlighten  # type: ignore[import-not-found]  # ty: ignore[unresolved-import]
     except ModuleNotFoundError:
         warnings.warn("You might want to 'pip install enlighten' for a nice progress bar", stacklevel=3)
 
-        return Mock()
+        return _NOOP
 
     # dirty, but otherwise a bit unclear how to share enlighten manager between packages that call each other
     instance = getattr(enlighten, 'INSTANCE', None)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO
+
+import pytest
+
+from .dal_helper import Json, json_items, json_items_async
+from .logging_helper import make_progress
+
+
+@pytest.fixture
+def export(tmp_path: Path) -> Path:
+    path = tmp_path / 'export.json'
+    path.write_text(json.dumps({'items': [{'id': i} for i in range(25)]}))
+    return path
+
+
+def test_json_items_reports_progress(export: Path) -> None:
+    logger = logging.getLogger('test_json_items_progress')
+    logger.setLevel(logging.INFO)
+    progress = make_progress(logger, 'load', total_bytes=export.stat().st_size)
+
+    items = list(json_items(export, 'items', progress=progress))
+
+    assert items == [{'id': i} for i in range(25)]
+    assert progress.count == 25
+    # ijson reads in chunks, so only checking it's roughly right
+    assert 0 < progress.nbytes <= export.stat().st_size
+
+
+class TrackedPath(Path):
+    """
+    Keeps track of files opened through it, to check they are closed.
+    """
+
+    opened: list[IO] = []  # noqa: RUF012
+
+    def open(self, *args, **kwargs):  # type: ignore[override]
+        fo = super().open(*args, **kwargs)
+        TrackedPath.opened.append(fo)
+        return fo
+
+
+@pytest.fixture
+def tracked_export(export: Path) -> Iterator[TrackedPath]:
+    TrackedPath.opened = []
+    yield TrackedPath(export)
+    assert len(TrackedPath.opened) > 0
+    assert all(fo.closed for fo in TrackedPath.opened)
+
+
+def test_json_items_async(tracked_export: TrackedPath) -> None:
+    async def run() -> list[Json]:
+        return [item async for item in json_items_async(tracked_export, 'items', batch_size=10, max_batches=1)]
+
+    assert asyncio.run(run()) == [{'id': i} for i in range(25)]
+
+
+def test_json_items_async_early_exit(tracked_export: TrackedPath) -> None:
+    async def run() -> list[Json]:
+        agen = json_items_async(tracked_export, 'items', batch_size=10, max_batches=1)
+        res = [await anext(agen)]
+        # the worker is blocked on the full queue at this point
+        await asyncio.sleep(0.1)
+        await asyncio.wait_for(agen.aclose(), timeout=3)
+        return res
+
+    assert asyncio.run(run()) == [{'id': 0}]
+
+
+def test_json_items_async_cancellation(tracked_export: TrackedPath) -> None:
+    consumed: list[Json] = []
+
+    async def consume() -> None:
+        async for item in json_items_async(tracked_export, 'items', batch_size=5, max_batches=1):
+            consumed.append(item)
+            await asyncio.sleep(10)
+
+    async def run() -> None:
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, timeout=3)
+
+    asyncio.run(run())
+    assert consumed == [{'id': 0}]
+
+
+def test_json_items_async_worker_error(tmp_path: Path) -> None:
+    async def run() -> list[Json]:
+        return [item async for item in json_items_async(tmp_path / 'missing.json', 'items')]
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(run())
+
+
+def test_json_items_async_other_coroutines_progress(export: Path) -> None:
+    async def run() -> int:
+        ticks = 0
+
+        async def ticker() -> None:
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        async for _ in json_items_async(export, 'items', batch_size=1, max_batches=1):
+            pass
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(run()) > 1
+
+
+def test_json_items_async_doesnt_hold_default_executor(export: Path) -> None:
+    async def run() -> int:
+        # single thread, so if a slow reader held it, to_thread below would never run
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=1))
+        readers = [json_items_async(export, 'items', batch_size=1, max_batches=1) for _ in range(2)]
+        for reader in readers:
+            await anext(reader)
+        res = await asyncio.wait_for(asyncio.to_thread(lambda: 123), timeout=3)
+        for reader in readers:
+            await reader.aclose()
+        return res
+
+    assert asyncio.run(run()) == 123
+
+
+def test_import_is_cheap() -> None:
+    # asyncio/concurrent.futures take a while to import, and most DALs don't need them
+    package = __name__.rpartition('.')[0]
+    modules = ['asyncio', 'concurrent.futures']
+    code = f'import sys; import {package}.dal_helper; print([m for m in {modules} if m in sys.modules])'
+    res = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=Path(__file__).absolute().parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert res.stdout.strip() == '[]'
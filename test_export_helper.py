@@ -1,11 +1,23 @@
 from __future__ import annotations
 
 import argparse
+import dataclasses
+import datetime
+import enum
+import json
+import logging
+import math
+import subprocess
+import sys
+import uuid
+from collections.abc import Iterator
 from pathlib import Path
 
 import pytest
 
-from .export_helper import Parser, setup_parser
+from . import export_helper
+from .dal_helper import json_items, json_items_concurrent
+from .export_helper import Checkpoint, Parser, setup_parser
 
 
 def make_legacy_test_parser(*, params: list[str]) -> argparse.ArgumentParser:
@@ -166,6 +178,26 @@ def test_default_dumper_writes_to_stdout(make_parser, capsys: pytest.CaptureFixt
     assert captured.err == ''
 
 
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dumpers_dont_set_up_logging(
+    make_parser,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsysbinary: pytest.CaptureFixture[bytes],
+) -> None:
+    log = tmp_path / 'export.log'
+    monkeypatch.setenv('LOGGING_FILE', str(log))
+
+    args = make_parser(params=['token']).parse_args(['--token', 'SECRET'])
+    args.dumper('{}')
+    args.dump_json({})
+    args.dump_items([])
+
+    assert capsysbinary.readouterr().err == b''
+    assert logging.getLogger(export_helper.__name__).handlers == []
+    assert not log.exists()
+
+
 @pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
 def test_output_path_dumper_writes_file_and_reports_path(
     make_parser,
@@ -181,3 +213,256 @@ def test_output_path_dumper_writes_file_and_reports_path(
     captured = capsys.readouterr()
     assert captured.out == ''
     assert captured.err == f'saved data to {output}\n'
+
+
+def run_export(args: argparse.Namespace, pages: list[list[int]], *, crash_after: int | None = None) -> None:
+    ck = args.checkpoint
+    start = 0 if ck.cursor is None else ck.cursor
+    for i in range(start, len(pages)):
+        if i == crash_after:
+            raise RuntimeError('rate limited')
+        ck.save(cursor=i + 1, items=pages[i])
+    args.dumper(json.dumps(ck.items))
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_state_resumes_interrupted_export(make_parser, tmp_path: Path) -> None:
+    pages = [[1, 2], [3], [4, 5, 6]]
+    state = tmp_path / 'state.json'
+    output = tmp_path / 'export.json'
+    argv = ['--token', 'SECRET', '--state', str(state), str(output)]
+
+    with pytest.raises(RuntimeError, match='rate limited'):
+        run_export(make_parser(params=['token']).parse_args(argv), pages, crash_after=2)
+    assert not output.exists()
+    assert state.exists()
+
+    args = make_parser(params=['token']).parse_args(argv)
+    assert args.checkpoint.cursor == 2
+    run_export(args, pages)
+
+    assert json.loads(output.read_text()) == [1, 2, 3, 4, 5, 6]
+    # state is cleaned up after successful dump
+    assert list(tmp_path.iterdir()) == [output]
+
+
+def test_state_discards_items_saved_without_cursor(tmp_path: Path) -> None:
+    state = tmp_path / 'state.json'
+    ck = Checkpoint(state)
+    ck.save(cursor='a', items=[{'id': 1}])
+    ck.save(cursor='b', items=[{'id': 2}])
+
+    # emulate crash after appending items, but before writing the cursor
+    items_path = tmp_path / 'state.json.items.jsonl'
+    with items_path.open('a') as fo:
+        fo.write('{"id": 3}\n{"id"')
+
+    ck = Checkpoint(state)
+    assert ck.cursor == 'b'
+    assert ck.items == [{'id': 1}, {'id': 2}]
+
+    ck.save(cursor='c', items=[{'id': 3}])
+    assert Checkpoint(state).items == [{'id': 1}, {'id': 2}, {'id': 3}]
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_checkpoint_without_state_is_in_memory(make_parser) -> None:
+    args = make_parser(params=['token']).parse_args(['--token', 'SECRET'])
+
+    assert args.checkpoint.path is None
+    args.checkpoint.save(cursor=1, items=[1, 2])
+
+    assert args.checkpoint.cursor == 1
+    assert args.checkpoint.items == [1, 2]
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dump_json_writes_bytes_to_stdout(make_parser, capsysbinary: pytest.CaptureFixture[bytes]) -> None:
+    args = make_parser(params=['token']).parse_args(['--token', 'SECRET'])
+
+    args.dump_json({'b': 'ü', 'a': [1, 2.5, None]})
+
+    captured = capsysbinary.readouterr()
+    assert captured.out == '{"b":"ü","a":[1,2.5,null]}'.encode()
+    assert captured.err == b''
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dump_json_sort_keys_writes_file(
+    make_parser,
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    output = tmp_path / 'export.json'
+
+    args = make_parser(params=['token']).parse_args(['--token', 'SECRET', str(output)])
+    args.dump_json({'b': 1, 'a': {'d': 2, 'c': 3}}, sort_keys=True)
+
+    assert output.read_bytes() == b'{"a":{"c":3,"d":2},"b":1}'
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert captured.err == f'saved data to {output}\n'
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dump_items_without_sharding_writes_single_file(make_parser, tmp_path: Path) -> None:
+    output = tmp_path / 'export.json'
+
+    args = make_parser(params=['token']).parse_args(['--token', 'SECRET', str(output)])
+    args.dump_items(iter([{'id': 1}, {'id': 2}]), key='items')
+
+    assert json.loads(output.read_text()) == {'items': [{'id': 1}, {'id': 2}]}
+    assert list(json_items(output, 'items')) == [{'id': 1}, {'id': 2}]
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dump_items_sharded_reads_back_as_single_source(make_parser, tmp_path: Path) -> None:
+    output = tmp_path / 'export.json'
+    items = [{'id': i, 'text': 'x' * (i % 7)} for i in range(25)]
+
+    args = make_parser(params=['token']).parse_args(['--token', 'SECRET', '--shard-items', '10', str(output)])
+    args.dump_items(iter(items), key='items')
+
+    manifest = json.loads(output.read_text())
+    assert manifest['items'] == 25
+    assert [s['items'] for s in manifest['shards']] == [10, 10, 5]
+    assert sorted(f'export.json.shards/{p.name}' for p in (tmp_path / 'export.json.shards').iterdir()) == [
+        s['path'] for s in manifest['shards']
+    ]
+    assert [s['path'].split('/')[1][:6] for s in manifest['shards']] == ['00000-', '00001-', '00002-']
+
+    assert list(json_items(output, 'items')) == items
+    assert list(json_items_concurrent(output, 'items', max_workers=2)) == items
+    with pytest.raises(RuntimeError, match='requested None'):
+        list(json_items(output, None))
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dump_items_sharded_by_size_rewrites_only_changed_shards(make_parser, tmp_path: Path) -> None:
+    output = tmp_path / 'export.json'
+    argv = ['--token', 'SECRET', '--shard-bytes', '100', str(output)]
+
+    items = [{'id': i} for i in range(30)]
+    make_parser(params=['token']).parse_args(argv).dump_items(items)
+    shards = sorted((tmp_path / 'export.json.shards').iterdir())
+    assert len(shards) > 2
+    assert all(p.stat().st_size <= 100 for p in shards)
+    mtimes = {p.name: p.stat().st_mtime_ns for p in shards}
+
+    # only the tail changes, and there are fewer items now
+    make_parser(params=['token']).parse_args(argv).dump_items(items[:-12])
+    new_shards = sorted((tmp_path / 'export.json.shards').iterdir())
+    assert len(new_shards) < len(shards)
+    assert new_shards[0].stat().st_mtime_ns == mtimes[new_shards[0].name]
+
+    assert list(json_items(output, None)) == items[:-12]
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dump_items_sharded_interrupted_keeps_old_export(make_parser, tmp_path: Path) -> None:
+    output = tmp_path / 'export.json'
+    argv = ['--token', 'SECRET', '--shard-items', '5', str(output)]
+
+    items = [{'id': i} for i in range(20)]
+    make_parser(params=['token']).parse_args(argv).dump_items(items)
+
+    def interrupted() -> Iterator[dict]:
+        for i in range(12):
+            yield {'id': i, 'changed': True}
+        raise RuntimeError('export failed')
+
+    with pytest.raises(RuntimeError, match='export failed'):
+        make_parser(params=['token']).parse_args(argv).dump_items(interrupted())
+
+    # new shards were written, but the old manifest still refers to intact old shards
+    assert list(json_items(output, None)) == items
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dump_items_sharded_cleans_up_leftover_tmp_files(make_parser, tmp_path: Path) -> None:
+    output = tmp_path / 'export.json'
+    shards_dir = tmp_path / 'export.json.shards'
+    shards_dir.mkdir()
+    # e.g. if the previous export was killed halfway through writing a shard
+    (shards_dir / '00000-0123456789abcdef.json.tmp').write_text('[{"id": ')
+
+    make_parser(params=['token']).parse_args(['--token', 'SECRET', '--shard-items', '5', str(output)]).dump_items([])
+
+    [manifest_shard] = json.loads(output.read_text())['shards']
+    assert [f'export.json.shards/{p.name}' for p in shards_dir.iterdir()] == [manifest_shard['path']]
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+@pytest.mark.parametrize('arg', ['--shard-items', '--shard-bytes'])
+def test_sharding_rejects_non_positive_sizes(
+    make_parser,
+    arg: str,
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    argv = ['--token', 'SECRET', arg, '0', str(tmp_path / 'export.json')]
+    error = parse_error(make_parser(params=['token']), argv, capsys)
+
+    assert f'{arg} should be positive, got 0' in error
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_sharding_requires_output_path(make_parser, capsys: pytest.CaptureFixture[str]) -> None:
+    error = parse_error(make_parser(params=['token']), ['--token', 'SECRET', '--shard-items', '10'], capsys)
+
+    assert 'Sharded output (--shard-items/--shard-bytes) requires path' in error
+
+
+@pytest.mark.parametrize('make_parser', EXPORT_PARSER_FACTORIES)
+def test_dump_json_handles_big_ints(make_parser, tmp_path: Path) -> None:
+    # orjson only supports 64 bit integers
+    output = tmp_path / 'export.json'
+
+    args = make_parser(params=['token']).parse_args(['--token', 'SECRET', str(output)])
+    args.dump_json({'id': 2**70, 'text': 'ü'})
+
+    assert output.read_bytes() == '{"id":1180591620717411303424,"text":"ü"}'.encode()
+
+
+class Color(enum.Enum):
+    RED = 'red'
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_json_serializer_same_output_without_orjson(monkeypatch: pytest.MonkeyPatch, *, use_orjson: bool) -> None:
+    if use_orjson:
+        pytest.importorskip('orjson')
+        serialize = export_helper._json_serializer(sort_keys=True)
+    else:
+        monkeypatch.setitem(sys.modules, 'orjson', None)
+        with pytest.warns(UserWarning, match='orjson'):
+            serialize = export_helper._json_serializer(sort_keys=True)
+
+    obj = {'x': math.nan, 'y': [math.inf, 1.5], 'id': uuid.UUID(int=1), 'color': Color.RED}
+    assert serialize(obj) == b'{"color":"red","id":"00000000-0000-0000-0000-000000000001","x":null,"y":[null,1.5]}'
+    # orjson falls back onto stdlib json for big ints
+    assert serialize({'x': math.nan, 'big': 2**70}) == b'{"big":1180591620717411303424,"x":null}'
+
+    for bad in [datetime.datetime(2020, 1, 1), {'at': datetime.date(2020, 1, 1)}, [Point(x=1)]]:
+        with pytest.raises(TypeError, match='not JSON serializable'):
+            serialize(bad)
+
+
+def test_import_is_cheap() -> None:
+    # exporters which don't shard shouldn't pay for dal_helper (or asyncio etc.)
+    package = __name__.rpartition('.')[0]
+    modules = [f'{package}.dal_helper', 'asyncio', 'concurrent.futures', 'hashlib']
+    code = f'import sys; import {package}.export_helper; print([m for m in {modules} if m in sys.modules])'
+    res = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=Path(__file__).absolute().parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert res.stdout.strip() == '[]'
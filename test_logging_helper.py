@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from .logging_helper import (
+    FORMAT_NOCOLOR,
+    NO_PROGRESS,
+    NO_TIMED,
+    BufferedFileHandler,
+    FastFormatter,
+    JsonFormatter,
+    enable_timing,
+    log_timings,
+    make_logger,
+    make_progress,
+    suppress_repeats,
+    timed,
+)
+
+
+def file_handler(logger: logging.Logger) -> BufferedFileHandler:
+    [handler] = [h for h in logger.handlers if isinstance(h, BufferedFileHandler)]
+    return handler
+
+
+def terminal_handlers(logger: logging.Logger) -> list[logging.Handler]:
+    return [h for h in logger.handlers if not isinstance(h, BufferedFileHandler)]
+
+
+def test_file_sink_logs_debug_while_terminal_keeps_level(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    log = tmp_path / 'export.log'
+    logger = make_logger('test_file_sink_levels', file=log)
+    # rejected by level before reaching the handler
+    [terminal] = terminal_handlers(logger)
+    assert terminal.level == logging.INFO
+
+    logger.debug('only in file')
+    logger.info('everywhere')
+    file_handler(logger).flush()
+
+    err = capsys.readouterr().err
+    assert 'everywhere' in err
+    assert 'only in file' not in err
+    lines = log.read_text().splitlines()
+    assert [l.split('] ')[1] for l in lines] == ['only in file', 'everywhere']
+    assert lines[0].startswith('[DEBUG ')
+
+
+def test_file_sink_doesnt_duplicate_terminal_handlers(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    name = 'test_file_sink_duplicate'
+    make_logger(name, file=tmp_path / 'export.log')
+    logger = make_logger(name, level='warning', file=tmp_path / 'export.log')
+
+    assert len(terminal_handlers(logger)) == 1
+    logger.warning('once')
+    assert capsys.readouterr().err.count('once') == 1
+
+
+def test_file_sink_terminal_follows_level_set_later(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    name = 'test_file_sink_set_level'
+    logger = make_logger(name, file=tmp_path / 'export.log')
+    logger.debug('hidden')
+
+    logging.getLogger(name).setLevel(logging.DEBUG)
+    [terminal] = terminal_handlers(logger)
+    assert terminal.level == logging.NOTSET
+    logger.debug('displayed')
+
+    err = capsys.readouterr().err
+    assert 'hidden' not in err
+    assert 'displayed' in err
+
+
+def make_record(msg: str, *args, level: int = logging.DEBUG) -> logging.LogRecord:
+    return logging.LogRecord('test', level, '/path/to/file.py', 12, msg, args, None)
+
+
+def test_buffered_handler_flushes_on_close(tmp_path: Path) -> None:
+    log = tmp_path / 'export.log'
+    handler = BufferedFileHandler(log)
+
+    handler.handle(make_record('buffered'))
+    assert not log.exists()
+    handler.close()
+
+    assert log.read_text().endswith('buffered\n')
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_buffered_handler_rotates_by_size(tmp_path: Path, *, compress: bool) -> None:
+    log = tmp_path / 'export.log'
+    handler = BufferedFileHandler(log, max_bytes=2000, backup_count=3, compress=compress)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+
+    for i in range(1000):
+        handler.handle(make_record('item %04d', i))
+    handler.close()
+
+    suffix = '.gz' if compress else ''
+    backups = [tmp_path / f'export.log.{i}{suffix}' for i in (1, 2, 3)]
+    assert sorted(tmp_path.iterdir()) == sorted([log, *backups])
+
+    def read(p: Path) -> bytes:
+        return gzip.decompress(p.read_bytes()) if p.suffix == '.gz' else p.read_bytes()
+
+    for p in [log, *backups]:
+        assert 0 < len(read(p)) <= 2000
+    assert read(log).splitlines()[-1] == b'item 0999'
+
+
+def test_fast_formatter_matches_regular_formatter() -> None:
+    record = make_record('item %d', 5)
+
+    assert FastFormatter().format(record) == logging.Formatter(FORMAT_NOCOLOR).format(record)
+
+
+def test_json_formatter(tmp_path: Path) -> None:
+    log = tmp_path / 'export.jsonl'
+    handler = BufferedFileHandler(log)
+    handler.setFormatter(JsonFormatter())
+
+    handler.handle(make_record('item %d', 1))
+    try:
+        raise ValueError('boom')
+    except ValueError as e:
+        record = make_record('failed', level=logging.ERROR)
+        record.exc_info = (type(e), e, e.__traceback__)
+        handler.handle(record)
+    handler.close()
+
+    [first, second] = [json.loads(line) for line in log.read_text().splitlines()]
+    assert first['message'] == 'item 1'
+    assert first['level'] == 'DEBUG'
+    assert second['message'] == 'failed'
+    assert 'ValueError: boom' in second['exc_info']
+
+
+def test_make_progress_is_noop_if_logger_disabled() -> None:
+    logger = make_logger('test_progress_disabled')
+
+    progress = make_progress(logger, 'items', level=logging.DEBUG)
+
+    assert progress is NO_PROGRESS
+    progress.update(10, nbytes=100)
+    progress.close()
+    assert (progress.count, progress.nbytes, progress.closed) == (0, 0, False)
+    assert progress.summary() == ''
+
+
+def test_progress_reports_throughput_and_summary(caplog: pytest.LogCaptureFixture) -> None:
+    logger = logging.getLogger('test_progress')
+    logger.setLevel(logging.INFO)
+
+    with caplog.at_level(logging.INFO, logger='test_progress'):
+        with make_progress(logger, 'fetch', total=4, interval=0) as progress:
+            progress.update(nbytes=1024)
+            progress.update(3, nbytes=1024)
+        progress.close()  # already closed, shouldn't log again
+
+    assert (progress.count, progress.nbytes, progress.closed) == (4, 2048, True)
+    messages = [r.getMessage() for r in caplog.records]
+    assert len(messages) == 3
+    assert messages[0].startswith('fetch: 1/4 items | ')
+    assert 'ETA' in messages[0]
+    assert '25%' in messages[0]
+    assert messages[-1].startswith('fetch: 4/4 items | ')
+    assert '2.0KB' in messages[-1]
+    assert '100%' in messages[-1]
+    assert 'ETA' not in messages[-1]
+
+
+@pytest.fixture
+def timing():
+    enable_timing()
+    yield
+    enable_timing(enabled=False)
+
+
+def test_timed_is_noop_when_disabled() -> None:
+    def fun() -> int:
+        return 1
+
+    assert timed('test_timed_disabled', 'span') is NO_TIMED
+    assert timed('test_timed_disabled', 'span')(fun) is fun
+    with NO_TIMED as span:
+        pass
+    assert span.hist.count == 0
+    assert span.name == ''
+
+
+@pytest.mark.usefixtures('timing')
+def test_timed_shared_between_threads() -> None:
+    span = timed('test_timed_threads', 'span')
+    entered = threading.Event()
+    done = threading.Event()
+
+    def worker() -> None:
+        with span:
+            entered.set()
+            done.wait()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    entered.wait()
+    time.sleep(0.05)
+    with span:
+        # the worker exits while the main thread is within the span, shouldn't take the main thread's start time
+        done.set()
+        thread.join()
+        time.sleep(0.1)
+
+    assert span.hist.count == 2
+    # worker took at least 0.05s, main thread at least 0.1s
+    assert span.hist.percentile(0.5) >= 0.05 / 1.1
+    assert span.hist.max >= 0.1
+
+
+@pytest.mark.usefixtures('timing')
+def test_timed_by_logger_name_logs_summary(capsys: pytest.CaptureFixture[str]) -> None:
+    with timed('test_timed_by_name', 'parse'):
+        pass
+
+    log_timings(reset=True)
+    assert 'timing parse: count=1 ' in capsys.readouterr().err
+
+
+@pytest.mark.usefixtures('timing')
+def test_timed_decorator_and_slow_spans(caplog: pytest.LogCaptureFixture) -> None:
+    logger = logging.getLogger('test_timed_slow')
+
+    @timed(logger, 'fun', slow=0.05)
+    def fun(delay: float) -> float:
+        time.sleep(delay)
+        return delay
+
+    with caplog.at_level(logging.WARNING, logger='test_timed_slow'):
+        assert [fun(d) for d in (0, 0, 0.06)] == [0, 0, 0.06]
+
+    assert [r.getMessage().split(':')[0] for r in caplog.records] == ['slow span fun']
+    summary = timed(logger, 'fun').hist.summary()
+    assert summary.startswith('count=3 ')
+
+
+def test_suppress_repeats(caplog: pytest.LogCaptureFixture) -> None:
+    logger = logging.getLogger('test_suppress_repeats')
+    filt = suppress_repeats(logger, window=3600, sample=40)
+
+    with caplog.at_level(logging.DEBUG, logger='test_suppress_repeats'):
+        for i in range(100):
+            logger.warning('missing field %s in item %d', 'x', i)
+        logger.error('missing field %s in item %d', 'x', 100)
+        filt.flush()
+
+    assert [r.getMessage() for r in caplog.records] == [
+        'missing field x in item 0',
+        'missing field x in item 40',
+        'missing field x in item 80',
+        'missing field x in item 100',
+        'suppressed 97 similar messages: missing field %s in item %d',
+    ]
+
+
+def test_suppress_repeats_reports_once_window_is_over(caplog: pytest.LogCaptureFixture) -> None:
+    logger = logging.getLogger('test_suppress_repeats_window')
+    suppress_repeats(logger, window=0.05)
+
+    with caplog.at_level(logging.DEBUG, logger='test_suppress_repeats_window'):
+        for i in range(10):
+            logger.warning('retrying %d', i)
+        time.sleep(0.06)
+        # any message after the window triggers the summary, no need to flush
+        logger.info('done')
+
+    assert [r.getMessage() for r in caplog.records] == [
+        'retrying 0',
+        'suppressed 9 similar messages: retrying %d',
+        'done',
+    ]
+
+
+def test_suppress_repeats_from_multiple_threads(caplog: pytest.LogCaptureFixture) -> None:
+    logger = logging.getLogger('test_suppress_repeats_threads')
+    # tiny window, so threads are sweeping all the time
+    filt = suppress_repeats(logger, window=0.0001)
+
+    def worker(n: int) -> None:
+        for i in range(2000):
+            logger.warning('message %d', (n * i) % 7)
+
+    with caplog.at_level(logging.WARNING, logger='test_suppress_repeats_threads'):
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        filt.flush()
+
+    shown = [r for r in caplog.records if not getattr(r, 'suppress_summary', False)]
+    suppressed = sum(int(r.getMessage().split()[1]) for r in caplog.records if getattr(r, 'suppress_summary', False))
+    assert len(shown) + suppressed == 4 * 2000